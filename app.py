@@ -1,11 +1,31 @@
 import os
+import atexit
+import gzip
+import hashlib
+import logging
+import queue
 import sqlite3
+import stat
 import threading
 import time
+import heapq
 import random
+import re
 import traceback
-from functools import wraps
-from flask import Flask, render_template, request, session, jsonify, redirect, url_for, g
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache, wraps
+import orjson
+try:
+    import brotli
+except ImportError:  # optional: without it every client gets gzip
+    brotli = None
+from jinja2 import FileSystemBytecodeCache
+from jinja2.ext import Extension
+from markupsafe import escape
+from flask import (Flask, render_template, request, session, jsonify, redirect, url_for, g,
+                   stream_with_context)
+from flask.json.provider import JSONProvider
 
 # ======================
 # CONFIGURATION
@@ -17,22 +37,244 @@ DB_PATH = os.environ.get('DATABASE_URL', os.path.join(BASE_DIR, 'market_crash.db
 ALT_DB_DIR = '/opt/extra1_1tb/database/market_crash'
 if os.path.exists(ALT_DB_DIR) and os.access(ALT_DB_DIR, os.W_OK):
     DB_PATH = os.path.join(ALT_DB_DIR, 'market_crash.db')
+# MARKET_CRASH_SIM=0 keeps the market simulation out of this process, for web workers
+# deployed next to a separate `python sim.py`
+RUN_SIMULATION = os.environ.get('MARKET_CRASH_SIM', '1') != '0'
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = os.environ.get('SECRET_KEY', 'market-crash-secret-key-change-in-prod')
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600
+# Templates ship with the code; never stat them for changes on a render
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+
+# The simulation loop logs through here; LOG_LEVEL=DEBUG adds one line per room per tick
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(JSONProvider):
+    """jsonify(), request.json and the session cookie through orjson, which
+    encodes to bytes in C instead of walking the object in Python.
+    """
+    mimetype = 'application/json'
+
+    @staticmethod
+    def _default(o):
+        if hasattr(o, '__html__'):
+            return str(o.__html__())
+        raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+    def dumps(self, obj, **kwargs):
+        # kwargs are stdlib json options (separators etc.); orjson output is always compact
+        return orjson.dumps(obj, default=self._default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self._default),
+                                        mimetype=self.mimetype)
+
+
+app.json = OrjsonProvider(app)
+
+
+class MinifyExtension(Extension):
+    """Strip indentation, blank lines and comments from template source before
+    Jinja compiles it. Only line-level edits, so no minifier dependency and no
+    risk of joining two JS statements that relied on a newline.
+    """
+    _HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+    _STYLE_BLOCK = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.S)
+    _SCRIPT_BLOCK = re.compile(r'(<script[^>]*>)(.*?)(</script>)', re.S)
+    _CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+    _JS_LINE_COMMENT = re.compile(r'^//.*\n', re.M)
+    _INDENT = re.compile(r'\n\s+')
+
+    def preprocess(self, source, name, filename=None):
+        source = self._INDENT.sub('\n', source.strip())
+        source = self._HTML_COMMENT.sub('', source)
+        source = self._STYLE_BLOCK.sub(
+            lambda m: m.group(1) + self._CSS_COMMENT.sub('', m.group(2)) + m.group(3), source)
+        source = self._SCRIPT_BLOCK.sub(
+            lambda m: m.group(1) + self._JS_LINE_COMMENT.sub('', m.group(2)) + m.group(3), source)
+        # Removing a comment can leave an empty line behind
+        return self._INDENT.sub('\n', source)
+
+
+# Page templates are developer-authored markup. Autoescape is off, and views escape
+# the few user-supplied values (player names) themselves before rendering.
+# Must be set before the first app.jinja_env access creates the environment.
+# trim_blocks keeps {% block %}/{% for %} tags from leaving blank lines in the output.
+app.jinja_options = {**app.jinja_options, 'autoescape': False, 'trim_blocks': True,
+                     'extensions': [MinifyExtension]}
+
+# Compiled template bytecode is kept on disk and shared by every worker and restart,
+# so a cold start loads it instead of running the Jinja parser and code generator.
+# Jinja keys the cache on template source only, so the file name also carries a
+# hash of this module: a change to the template pipeline can't load stale bytecode.
+# Jinja unmarshals (i.e. executes) whatever it finds there, so the directory must be
+# private to this user: unset, Jinja picks its own per-uid 0700 directory and checks it.
+JINJA_CACHE_DIR = os.environ.get('MARKET_CRASH_JINJA_CACHE') or None
+
+
+def _private_cache_dir(path):
+    """The same guard Jinja applies to its default directory, for a configured one"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"Jinja cache directory {path} must be a directory owned by "
+                           f"this user and not accessible to others (mode 0700)")
+    return path
+
+
+with open(__file__, 'rb') as _module_source:
+    _JINJA_CACHE_TAG = hashlib.md5(_module_source.read()).hexdigest()[:8]
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+    JINJA_CACHE_DIR and _private_cache_dir(JINJA_CACHE_DIR),
+    pattern=f'__jinja2_{_JINJA_CACHE_TAG}_%s.cache')
+
+# Static assets are linked as /static/<file>?v=<content hash>. A versioned URL never
+# changes meaning, so browsers may keep it for a year and share it across rooms.
+def _hash_static_files():
+    hashes = {}
+    for root, _dirs, files in os.walk(app.static_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()[:8]
+            hashes[os.path.relpath(path, app.static_folder).replace(os.sep, '/')] = digest
+    return hashes
+
+
+STATIC_HASHES = _hash_static_files()
+STATIC_IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+@app.template_global()
+def static_url(filename):
+    return url_for('static', filename=filename, v=STATIC_HASHES.get(filename))
+
+
+@app.after_request
+def cache_versioned_static(response):
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and request.args.get('v') == STATIC_HASHES.get(request.view_args.get('filename'))):
+        response.headers['Cache-Control'] = STATIC_IMMUTABLE
+    return response
+
+
+# Parse and compile every page template once at import, so no request (including
+# the first one after a worker starts) pays for it. render_template() accepts the
+# Template objects directly and still applies context processors.
+COMPILED_TEMPLATES = {
+    name: app.jinja_env.get_template(f'{name}.html')
+    for name in ('index', 'room')
+}
+
+
+def page_template(name):
+    """The precompiled Template, or, while templates auto-reload, the loader's current
+    one (get_template() recompiles it when the file has changed)
+    """
+    if app.jinja_env.auto_reload:
+        return app.jinja_env.get_template(f'{name}.html')
+    return COMPILED_TEMPLATES[name]
+
+
+def render_page(name, **context):
+    """The one way pages are rendered"""
+    return render_template(page_template(name), **context)
 
 
 # ======================
 # DATABASE
 # ======================
-def get_db_connection():
-    """Create a new database connection with timeout for concurrency"""
-    conn = sqlite3.connect(DB_PATH, timeout=10)
+# Per-connection tuning. journal_mode=WAL is persistent and set once in init_db();
+# these settings are not, so every new connection has to apply them.
+BUSY_TIMEOUT = 5  # seconds a statement waits on another process's lock
+CONNECTION_PRAGMAS = (
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}',
+    'PRAGMA synchronous=NORMAL',      # safe under WAL, fsync on checkpoint only
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',     # 256 MB
+    'PRAGMA cache_size=-65536',       # 64 MB
+    'PRAGMA foreign_keys=ON',
+    # No commit should pay for a checkpoint; the simulation thread runs them
+    # on its own timer instead (see market_simulation_loop).
+    'PRAGMA wal_autocheckpoint=0',
+)
+
+WAL_CHECKPOINT_INTERVAL = 60  # seconds
+
+
+# Hot statements, kept as constants so every call site sends byte-identical SQL and
+# hits the connection's prepared-statement cache instead of re-parsing.
+# Ages are computed by SQLite as integer seconds, so no timestamps are parsed in Python
+SQL_ROOM_STATE = '''SELECT *, strftime('%s', 'now') - strftime('%s', created_at) AS created_age,
+                    strftime('%s', 'now') - strftime('%s', last_updated) AS updated_age
+                    FROM rooms WHERE room_id=?'''
+SQL_PLAYER_IDENTITY = 'SELECT room_id, player_name FROM players WHERE id=? AND is_active=1'
+SQL_PLAYER_HOLDINGS = 'SELECT cash, shares_held FROM players WHERE id=?'
+# Everything the in-memory room state needs, as one statement: one compile, one
+# cursor walk, and a consistent snapshot without an explicit read transaction.
+# Rows are tagged by kind and share generic columns (n1..n3 numeric, txt, ts).
+SQL_ROOM_AGGREGATE = '''
+    SELECT 'r' AS kind, NULL AS id, NULL AS name, revision AS n1, current_price AS n2, NULL AS n3,
+           NULL AS txt, NULL AS ts
+      FROM rooms WHERE room_id=:room_id
+    UNION ALL
+    SELECT 'p', id, player_name, cash, shares_held, NULL, NULL, NULL
+      FROM players WHERE room_id=:room_id AND is_active=1
+    UNION ALL
+    SELECT * FROM (SELECT 't', t.id, p.player_name, t.shares, t.price_per_share, t.total_amount, t.type, t.timestamp
+                     FROM transactions t JOIN players p ON t.player_id=p.id WHERE t.room_id=:room_id
+                     ORDER BY t.id DESC LIMIT 8)
+    UNION ALL
+    SELECT * FROM (SELECT 'h', id, NULL, round_number, price, NULL, event_type, NULL
+                     FROM price_history WHERE room_id=:room_id ORDER BY round_number DESC LIMIT 10)
+    UNION ALL
+    SELECT * FROM (SELECT 'c', id, player_name, is_system, NULL, NULL, message, timestamp
+                     FROM chat_messages WHERE room_id=:room_id ORDER BY timestamp DESC LIMIT 50)'''
+SQL_UPDATE_ROOM = '''UPDATE rooms SET current_price=?, round_number=?, is_active=?, 
+                     crash_occurred=?, last_updated=CURRENT_TIMESTAMP, revision=revision+1
+                     WHERE room_id=?'''
+SQL_INSERT_PRICE = '''INSERT INTO price_history (room_id, round_number, price, event_type) 
+                      VALUES (?, ?, ?, ?)'''
+SQL_INSERT_NEWS = '''INSERT INTO chat_messages (room_id, player_name, message, is_system)
+                     VALUES (?, 'MARKET NEWS', ?, 1)'''
+# Money is rounded to cents when it is written (prices by MarketEngine, trade totals
+# by trade_job, balances in the trade UPDATEs), so responses can send the stored
+# values as they are.
+SQL_MARKET_OPEN = '''EXISTS (SELECT 1 FROM rooms WHERE rooms.room_id=players.room_id
+                                AND is_active=1 AND crash_occurred=0)'''
+# Check-and-update in one statement: the WHERE clause tests funds/holdings and that the
+# market is still open against committed rows, so two concurrent requests (or a crash
+# landing between the route's room read and the write) can't slip past a Python check.
+SQL_BUY_UPDATE = '''UPDATE players SET cash = ROUND(cash - :total, 2), shares_held = shares_held + :shares
+                    WHERE id=:player_id AND cash >= :total AND ''' + SQL_MARKET_OPEN
+SQL_SELL_UPDATE = '''UPDATE players SET cash = ROUND(cash + :total, 2), shares_held = shares_held - :shares
+                     WHERE id=:player_id AND shares_held >= :shares AND ''' + SQL_MARKET_OPEN
+SQL_INSERT_TX = '''INSERT INTO transactions (room_id, player_id, type, shares, price_per_share, total_amount)
+                   VALUES (?, ?, ?, ?, ?, ?)'''
+SQL_BUMP_REVISION = 'UPDATE rooms SET revision = revision + 1 WHERE room_id=?'
+SQL_GET_REVISION = 'SELECT revision FROM rooms WHERE room_id=?'
+
+# The default of 128 is shared by every statement a connection ever runs
+DB_CACHED_STATEMENTS = 256
+
+
+def get_db_connection(autocommit=False):
+    """Create a new database connection with timeout for concurrency.
+    autocommit=True turns off the sqlite3 module's implicit BEGINs, for long-lived
+    connections that issue BEGIN/COMMIT themselves.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=5, cached_statements=DB_CACHED_STATEMENTS,
+                           isolation_level=None if autocommit else '')
     conn.row_factory = sqlite3.Row
-    # Enable WAL mode for better concurrency (multiple readers, one writer)
-    conn.execute('PRAGMA journal_mode=WAL')
-    conn.execute('PRAGMA foreign_keys = ON')
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
@@ -45,6 +287,11 @@ def init_db():
             
         print(f"Initializing database at: {DB_PATH}")
         db = get_db_connection()
+        # WAL lets the simulation writer run alongside the polling readers. SQLite
+        # quietly keeps the old mode where WAL is unsupported (e.g. network mounts).
+        mode = db.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if mode.lower() != 'wal':
+            print(f"⚠ journal_mode is {mode}, not WAL: readers will block on every write")
         c = db.cursor()
 
         # Create all tables
@@ -54,6 +301,7 @@ def init_db():
             round_number INTEGER NOT NULL DEFAULT 0,
             is_active INTEGER NOT NULL DEFAULT 1,
             crash_occurred INTEGER NOT NULL DEFAULT 0,
+            revision INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )''')
@@ -102,10 +350,18 @@ def init_db():
             FOREIGN KEY (room_id) REFERENCES rooms(room_id) ON DELETE CASCADE
         )''')
 
+        # Columns added after the first release
+        ensure_column(c, 'rooms', 'revision', 'INTEGER NOT NULL DEFAULT 0')
+
         # Create indexes
         c.execute('CREATE INDEX IF NOT EXISTS idx_rooms_active ON rooms(is_active, crash_occurred, round_number)')
         c.execute('CREATE INDEX IF NOT EXISTS idx_players_room ON players(room_id, is_active)')
+        # The leaderboard is ranked in Python from the in-memory room state
+        c.execute('DROP INDEX IF EXISTS idx_players_leaderboard')
         c.execute('CREATE INDEX IF NOT EXISTS idx_chat_room ON chat_messages(room_id, timestamp)')
+        # id is monotonic in insert order and, unlike timestamp, has no same-second ties
+        c.execute('CREATE INDEX IF NOT EXISTS idx_tx_room_id_desc ON transactions(room_id, id DESC)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_price_history_room_round ON price_history(room_id, round_number DESC)')
 
         db.commit()
         db.close()
@@ -116,17 +372,44 @@ def init_db():
         raise
 
 
+def ensure_column(c, table, column, decl):
+    """Add a column to an existing table if an older database lacks it.
+    Returns True when the column was added, so the caller can backfill it.
+    """
+    columns = {row['name'] for row in c.execute(f'PRAGMA table_info({table})')}
+    if column in columns:
+        return False
+    c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+    return True
+
+
+def bump_revision(db, room_id):
+    """Mark the room's visible state as changed; call inside the writing transaction.
+    Returns the new revision.
+    """
+    db.execute(SQL_BUMP_REVISION, (room_id,))
+    return db.execute(SQL_GET_REVISION, (room_id,)).fetchone()[0]
+
+
+# Request threads are long-lived under gunicorn, so each keeps one read connection
+# (and with it, its statement cache) rather than reconnecting per request.
+_thread_db = threading.local()
+
+
 def get_db():
     if 'db' not in g:
-        g.db = get_db_connection()
+        conn = getattr(_thread_db, 'conn', None)
+        if conn is None:
+            conn = _thread_db.conn = get_db_connection(autocommit=True)
+        g.db = conn
     return g.db
 
 
 @app.teardown_appcontext
 def close_db(error):
     db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    if db is not None and db.in_transaction:
+        db.rollback()
 
 
 # ======================
@@ -136,8 +419,12 @@ class MarketEngine:
     MAX_ROUNDS = 10
     CRASH_PROBABILITY = 0.10
     BIG_MOVE_PROBABILITY = 0.20
-    NORMAL_VOLATILITY = (0.90, 1.10)
-    BIG_VOLATILITY = (0.75, 1.25)
+    # (low, width) per volatility band, so a factor is one random() call:
+    # rounds 1-4, 5-7, 8+, then the big-move band that overrides all of them
+    _NORMAL_BAND = (0.90, 0.20)
+    _MID_BAND = (0.85, 0.35)
+    _LATE_BAND = (0.80, 0.50)
+    _BIG_BAND = (0.75, 0.50)
 
     NEWS_HEADLINES = {
         "SURGE": [
@@ -185,55 +472,91 @@ class MarketEngine:
     }
 
     @staticmethod
-    def get_news(event_type):
-        return random.choice(MarketEngine.NEWS_HEADLINES.get(event_type, ["Market is unpredictable."]))
-
-    @staticmethod
-    def calculate_new_price(current_price, round_num):
-        if random.random() < MarketEngine.CRASH_PROBABILITY:
-            return 0.01, "CRASH", True, MarketEngine.get_news("CRASH")
-
-        if round_num > 7:
-            volatility = (0.80, 1.30)
-        elif round_num > 4:
-            volatility = (0.85, 1.20)
-        else:
-            volatility = MarketEngine.NORMAL_VOLATILITY
-
-        if random.random() < MarketEngine.BIG_MOVE_PROBABILITY:
-            volatility = MarketEngine.BIG_VOLATILITY
-
-        factor = random.uniform(volatility[0], volatility[1])
-        new_price = max(0.01, round(current_price * factor, 2))
-
-        if factor > 1.15:
-            event_type = "SURGE"
-        elif factor > 1.05:
-            event_type = "RISE"
-        elif factor < 0.85:
-            event_type = "CRASH_WARNING"
-        elif factor < 0.95:
-            event_type = "DROP"
-        else:
-            event_type = "STABLE"
-
-        return new_price, event_type, False, MarketEngine.get_news(event_type)
+    def batch_calculate(prices, rounds):
+        """Advance every due room of a tick in one call.
+        Returns a list of (new_price, event_type, is_crash, news) tuples in input order.
+        """
+        # Bind everything the per-room body touches once per tick, not once per room
+        rand = random.random
+        choice = random.choice
+        headlines = MarketEngine.NEWS_HEADLINES
+        crash_probability = MarketEngine.CRASH_PROBABILITY
+        big_move_probability = MarketEngine.BIG_MOVE_PROBABILITY
+        normal_band = MarketEngine._NORMAL_BAND
+        mid_band = MarketEngine._MID_BAND
+        late_band = MarketEngine._LATE_BAND
+        big_band = MarketEngine._BIG_BAND
+
+        results = []
+        append = results.append
+        for current_price, round_num in zip(prices, rounds):
+            if rand() < crash_probability:
+                append((0.01, "CRASH", True, choice(headlines["CRASH"])))
+                continue
+
+            if rand() < big_move_probability:
+                low, width = big_band
+            elif round_num > 7:
+                low, width = late_band
+            elif round_num > 4:
+                low, width = mid_band
+            else:
+                low, width = normal_band
+
+            # Same distribution as random.uniform(low, low + width), minus its call overhead
+            factor = low + width * rand()
+            new_price = max(0.01, round(current_price * factor, 2))
+
+            if factor > 1.15:
+                event_type = "SURGE"
+            elif factor > 1.05:
+                event_type = "RISE"
+            elif factor < 0.85:
+                event_type = "CRASH_WARNING"
+            elif factor < 0.95:
+                event_type = "DROP"
+            else:
+                event_type = "STABLE"
+
+            append((new_price, event_type, False, choice(headlines[event_type])))
+        return results
+
+
+# Status lines only depend on the room's phase, so build them once instead of per poll
+STATUS_CRASHED = "MARKET CRASHED! Game over."
+STATUS_COMPLETED = f"Game completed {MarketEngine.MAX_ROUNDS} rounds!"
+STATUS_WAITING = "Waiting for players... Game starts soon!"
+STATUS_ROUND = tuple(f"Round {n} of {MarketEngine.MAX_ROUNDS}" for n in range(MarketEngine.MAX_ROUNDS + 1))
+
+# The sim thread looks for due rooms on a fixed cadence measured from the start of
+# each pass, so the time a pass takes doesn't push later passes back. Waiting on an
+# Event instead of sleeping lets shutdown interrupt the wait.
+SIM_POLL_INTERVAL = 2  # seconds
+SIM_SHUTDOWN = threading.Event()
 
 
 def market_simulation_loop():
     """Background thread to update markets. 
-    Uses a 'last_updated' check to prevent redundant updates from multiple workers.
+    Picks due rooms inside a BEGIN IMMEDIATE transaction so that multiple
+    workers can never advance the same room twice.
     """
-    print("✓ Market simulation engine started")
-    while True:
+    logger.info("✓ Market simulation engine started")
+    # One long-lived connection for the lifetime of the thread; reconnecting
+    # every tick re-runs the connection setup and throws away the page cache.
+    db = get_db_connection(autocommit=True)  # BEGIN IMMEDIATE / COMMIT are issued below
+    next_checkpoint = time.monotonic() + WAL_CHECKPOINT_INTERVAL
+    next_pass = time.monotonic()
+    while not SIM_SHUTDOWN.is_set():
+        next_pass += SIM_POLL_INTERVAL
         try:
-            # Connect and use a short timeout
-            db = get_db_connection()
             c = db.cursor()
+            # Take the write lock before selecting: no other worker can touch
+            # these rooms until we commit, so the UPDATEs need no re-check.
+            c.execute('BEGIN IMMEDIATE')
             
             # Select rooms that haven't been updated in at least 9.5 seconds
             # For round 0 (waiting), we wait until the room is 20s old to allow players to join
-            c.execute('''SELECT room_id, current_price, round_number FROM rooms 
+            c.execute('''SELECT room_id, current_price, round_number, revision FROM rooms 
                         WHERE is_active=1 AND crash_occurred=0 AND round_number < ?
                         AND (
                             (round_number > 0 AND last_updated < datetime('now', '-9.5 seconds'))
@@ -243,56 +566,508 @@ def market_simulation_loop():
                       (MarketEngine.MAX_ROUNDS,))
             rooms = c.fetchall()
 
-            for room in rooms:
-                room_id = room['room_id']
-                price = room['current_price']
-                round_num = room['round_number'] + 1
-
-                new_price, event, is_crash, news_text = MarketEngine.calculate_new_price(price, round_num)
+            room_ids = [room['room_id'] for room in rooms]
+            round_nums = [room['round_number'] + 1 for room in rooms]
+            results = MarketEngine.batch_calculate([room['current_price'] for room in rooms], round_nums)
 
+            room_updates = []
+            price_rows = []
+            news_rows = []
+            for room_id, round_num, (new_price, event, is_crash, news_text) in zip(room_ids, round_nums, results):
                 is_active = 0 if (is_crash or round_num >= MarketEngine.MAX_ROUNDS) else 1
                 crash_occurred = 1 if is_crash else 0
 
-                # Use a more specific UPDATE to ensure we don't double-update if another worker just did
-                c.execute('''UPDATE rooms SET current_price=?, round_number=?, is_active=?, 
-                            crash_occurred=?, last_updated=CURRENT_TIMESTAMP 
-                            WHERE room_id=? AND (
-                                (round_number > 0 AND last_updated < datetime('now', '-9 seconds'))
-                                OR 
-                                (round_number = 0 AND created_at < datetime('now', '-18 seconds'))
-                            )''',
-                          (new_price, round_num, is_active, crash_occurred, room_id))
-                
-                if c.rowcount > 0:
-                    c.execute('''INSERT INTO price_history (room_id, round_number, price, event_type) 
-                                VALUES (?, ?, ?, ?)''', (room_id, round_num, new_price, event))
-                    
-                    # Insert system news message
-                    c.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
-                                VALUES (?, 'MARKET NEWS', ?, 1)''', (room_id, news_text))
-
-                    if is_crash:
-                        print(f"!!! MARKET CRASH in room {room_id} at round {round_num} !!!")
-
-            db.commit()
-            db.close()
+                room_updates.append((new_price, round_num, is_active, crash_occurred, room_id))
+                price_rows.append((room_id, round_num, new_price, event))
+                news_rows.append((room_id, news_text))
+
+
+            # One round-trip per statement kind instead of per room
+            c.executemany(SQL_UPDATE_ROOM, room_updates)
+            c.executemany(SQL_INSERT_PRICE, price_rows)
+            # System news message per room
+            c.executemany(SQL_INSERT_NEWS, news_rows)
+
+            c.execute('COMMIT')
+
+            for room, update, price_row, news_row in zip(rooms, room_updates, price_rows, news_rows):
+                apply_room_delta(room['room_id'], room['revision'] + 1, record_tick,
+                                 update[0], update[1], price_row[3], news_row[1])
+
+            if rooms and logger.isEnabledFor(logging.INFO):
+                crashes = sum(update[3] for update in room_updates)
+                completed = sum(1 for update in room_updates if not update[2]) - crashes
+                logger.info("tick summary: %d rooms, %d crashes, %d completed",
+                            len(rooms), crashes, completed)
+                if logger.isEnabledFor(logging.DEBUG):
+                    for new_price, round_num, is_active, crash_occurred, room_id in room_updates:
+                        logger.debug("Room %s | Round %d | $%.2f%s", room_id, round_num, new_price,
+                                     " | MARKET CRASH" if crash_occurred else "")
         except Exception as e:
-            print(f"✗ Market sim error: {e}")
+            logger.error("✗ Market sim error: %s", e)
+            try:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+            except sqlite3.Error:
+                # The handle itself is unusable; start over with a fresh one
+                db.close()
+                db = get_db_connection(autocommit=True)
             # traceback.print_exc()
-        
-        # Sleep for a bit before checking again
-        time.sleep(2)
+
+        # PASSIVE never waits on readers or writers; whatever it can't copy
+        # back now is picked up next time round.
+        if time.monotonic() >= next_checkpoint:
+            next_checkpoint = time.monotonic() + WAL_CHECKPOINT_INTERVAL
+            try:
+                db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            except sqlite3.Error as e:
+                logger.warning("✗ WAL checkpoint failed: %s", e)
+
+        # Fell more than a whole interval behind: start counting again from now
+        # rather than running the missed passes back to back
+        now = time.monotonic()
+        if next_pass < now:
+            next_pass = now
+        SIM_SHUTDOWN.wait(next_pass - now)
+
+    db.close()
+    logger.info("✓ Market simulation engine stopped")
+
+
+# ======================
+# ROOM STATE CACHE
+# ======================
+# Every write that changes what players see bumps rooms.revision. Writers in this
+# process also patch ROOM_STATE after committing, so the polling endpoint can be
+# served from memory; an entry whose revision falls behind the database (a write
+# from another worker) is simply reloaded.
+MAX_CACHED_ROOMS = 256
+ROOM_STATE = {}
+ROOM_STATE_LOCK = threading.Lock()
+
+# room_id -> (revision, expires_at, shared payload). The TTL only bounds how long
+# the simulated order book sits still between writes. The lock only covers lookups
+# and stores; payloads are built outside it.
+STATE_CACHE = {}
+STATE_CACHE_LOCK = threading.Lock()
+STATE_CACHE_TTL = 2.0
+
+LEADERBOARD_SIZE = 20
+# Shared payload keys that need no per-player edits
+SHARED_TAIL_KEYS = ('transactions', 'price_history', 'chat', 'order_book')
+
+# room_id -> change counter, bumped after every write this process commits, so
+# streams can sleep on ROOM_CHANGED instead of polling the database
+ROOM_VERSIONS = {}
+ROOM_CHANGED = threading.Condition()
+
+STREAM_CHECK_INTERVAL = 1.0   # re-read the room row at least this often
+LONG_POLL_TIMEOUT = 25
+STREAM_KEEPALIVE = 15         # comment line so idle proxies keep the connection
+STREAM_MAX_AGE = 300          # then end; EventSource reconnects and frees the thread
+STREAM_RETRY = b'retry: 3000\n\n'
+
+# An open stream or a held long-poll occupies one worker thread for its whole life, so
+# cap them per process below the thread count (GUNICORN_THREADS, as in gunicorn_conf.py)
+# and keep HELD_RESERVE threads for trades, joins and page loads. Over the cap both are
+# refused with a 503: the client falls back from the stream to long-polling, and from
+# long-polling to a plain poll every POLL_INTERVAL.
+HELD_RESERVE = 16
+MAX_HELD_REQUESTS = max(1, int(os.environ.get('GUNICORN_THREADS', 64)) - HELD_RESERVE)
+HELD_REQUESTS = threading.BoundedSemaphore(MAX_HELD_REQUESTS)
+
+
+def server_busy():
+    response = jsonify({'error': 'Server busy'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def cache_put(cache, key, value):
+    cache[key] = value
+    if len(cache) > MAX_CACHED_ROOMS:
+        # Dicts keep insertion order, so this drops the oldest room
+        cache.pop(next(iter(cache)), None)
+
+
+def utc_timestamp():
+    """Same format SQLite's CURRENT_TIMESTAMP produces"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def tx_entry(player_name, tx_type, shares, price, total, timestamp):
+    return {
+        'player_name': player_name,
+        'type': tx_type.upper(),
+        'shares': shares,
+        'price': price,
+        'total': total,
+        'timestamp': str(timestamp)
+    }
+
+
+def chat_entry(player_name, message, is_system, timestamp):
+    return {
+        'player': player_name,
+        'message': message,
+        'is_system': bool(is_system),
+        'time': str(timestamp)[11:16] # HH:MM format
+    }
+
+
+def load_room_aggregate(db, room_id):
+    """Read a room's players, recent trades, price history and chat in one snapshot"""
+    rows = {'r': [], 'p': [], 't': [], 'h': [], 'c': []}
+    for row in db.execute(SQL_ROOM_AGGREGATE, {'room_id': room_id}):
+        rows[row['kind']].append(row)
+    room = rows['r'][0]
+    # UNION ALL does not promise arm order, so order each group here
+    txns = sorted(rows['t'], key=lambda t: t['id'], reverse=True)
+    history = sorted(rows['h'], key=lambda h: h['n1'])
+    chats = sorted(rows['c'], key=lambda c: (c['ts'], c['id']))
+
+    return {
+        'revision': room['n1'],
+        'price': room['n2'],
+        'players': {p['id']: {
+            'player_name': p['name'],
+            'cash': p['n1'],
+            'shares_held': p['n2'],
+            'total_value': round(p['n1'] + p['n2'] * room['n2'], 2)
+        } for p in rows['p']},
+        # Newest first
+        'recent_tx': deque((tx_entry(t['name'], t['txt'], t['n1'], t['n2'], t['n3'], t['ts'])
+                            for t in txns), maxlen=8),
+        # Oldest first, as the client renders them
+        'price_history': deque(({'round': h['n1'], 'price': h['n2'], 'event': h['txt']}
+                                for h in history), maxlen=10),
+        'chat': deque((chat_entry(c['name'], c['txt'], c['n1'], c['ts']) for c in chats), maxlen=50)
+    }
+
+
+def get_room_aggregate(db, room):
+    """Return the in-memory state for a room, at least as new as the given room row"""
+    room_id = room['room_id']
+    with ROOM_STATE_LOCK:
+        agg = ROOM_STATE.get(room_id)
+        if agg is not None and agg['revision'] >= room['revision']:
+            return agg
+
+    agg = load_room_aggregate(db, room_id)
+    with ROOM_STATE_LOCK:
+        current = ROOM_STATE.get(room_id)
+        if current is None or current['revision'] < agg['revision']:
+            cache_put(ROOM_STATE, room_id, agg)
+    return agg
+
+
+def apply_room_delta(room_id, revision, fn, *args):
+    """Patch a cached room after a committed write that produced `revision`.
+    If any other write landed in between, or fn fails part-way, the entry is dropped
+    and reloaded on next read.
+    """
+    try:
+        with ROOM_STATE_LOCK:
+            agg = ROOM_STATE.get(room_id)
+            if agg is not None:
+                if agg['revision'] != revision - 1:
+                    del ROOM_STATE[room_id]
+                else:
+                    try:
+                        fn(agg, *args)
+                    except Exception:
+                        del ROOM_STATE[room_id]
+                        raise
+                    agg['revision'] = revision
+    finally:
+        # The write is committed either way
+        notify_room_changed(room_id)
+
+
+def room_version(room_id):
+    return ROOM_VERSIONS.get(room_id, 0)
+
+
+def notify_room_changed(room_id):
+    with ROOM_CHANGED:
+        cache_put(ROOM_VERSIONS, room_id, room_version(room_id) + 1)
+        ROOM_CHANGED.notify_all()
+
+
+def wait_room_changed(room_id, seen, timeout):
+    """Block until room_version(room_id) moves past `seen`, or timeout"""
+    with ROOM_CHANGED:
+        ROOM_CHANGED.wait_for(lambda: room_version(room_id) != seen, timeout)
+
+
+def wait_for_revision(db, room_id, revision, timeout):
+    """Wait up to `timeout` seconds for the room's revision to differ from `revision`.
+    Wakes at once for writes committed by this process and re-reads the row every
+    STREAM_CHECK_INTERVAL for those of other processes. Returns the latest room
+    row, or None if the room is gone.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        seen = room_version(room_id)
+        row = db.execute(SQL_ROOM_STATE, (room_id,)).fetchone()
+        remaining = deadline - time.monotonic()
+        if row is None or row['revision'] != revision or remaining <= 0:
+            return row
+        wait_room_changed(room_id, seen, min(remaining, STREAM_CHECK_INTERVAL))
+
+
+def fresh_holdings(db, room, player_id):
+    return cached_holdings(room, player_id) or db.execute(SQL_PLAYER_HOLDINGS, (player_id,)).fetchone()
+
+
+def record_trade(agg, player_id, player_name, tx_type, shares, price, total):
+    # The entry matched the database right before this trade, so relative updates are exact
+    p = agg['players'][player_id]
+    if tx_type == 'buy':
+        p['cash'] = round(p['cash'] - total, 2)
+        p['shares_held'] += shares
+    else:
+        p['cash'] = round(p['cash'] + total, 2)
+        p['shares_held'] -= shares
+    p['total_value'] = round(p['cash'] + p['shares_held'] * agg['price'], 2)
+    agg['recent_tx'].appendleft(tx_entry(player_name, tx_type, shares, price, total, utc_timestamp()))
+
+
+def record_chat(agg, player_name, message, is_system):
+    agg['chat'].append(chat_entry(player_name, message, is_system, utc_timestamp()))
+
+
+def record_join(agg, player_id, player_name):
+    agg['players'][player_id] = {'player_name': player_name, 'cash': 1000.0,
+                                 'shares_held': 0, 'total_value': 1000.0}
+    record_chat(agg, 'SYSTEM', f"{player_name} joined the room.", True)
+
+
+def record_tick(agg, new_price, round_num, event, news_text):
+    agg['price'] = new_price
+    for p in agg['players'].values():
+        p['total_value'] = round(p['cash'] + p['shares_held'] * new_price, 2)
+    agg['price_history'].append({'round': round_num, 'price': new_price, 'event': event})
+    record_chat(agg, 'MARKET NEWS', news_text, True)
+
+
+def build_shared_state(agg):
+    """Build the player-independent part of the room_state payload.
+    Leaderboard entries are (player_id, entry) pairs so callers can mark their own row.
+    'revision' is read under the same lock as the content, so it labels exactly this snapshot.
+    """
+    with ROOM_STATE_LOCK:
+        # The aggregate tracks every player; only the top of the table is sent
+        top = heapq.nlargest(LEADERBOARD_SIZE, agg['players'].items(), key=lambda item: item[1]['total_value'])
+        return {
+            'revision': agg['revision'],
+            'leaderboard': [(pid, {
+                'player_name': p['player_name'],
+                'cash': p['cash'],
+                'shares': p['shares_held'],
+                'total_value': p['total_value']
+            }) for pid, p in top],
+            'transactions': list(agg['recent_tx']),
+            'price_history': list(agg['price_history']),
+            'chat': list(agg['chat']),
+            'order_book': generate_order_book(agg['price'])
+        }
+
+
+def get_shared_state(db, room):
+    """Shared room_state payload for the room row's revision, built at most once per TTL"""
+    now = time.time()
+    with STATE_CACHE_LOCK:
+        cached = STATE_CACHE.get(room['room_id'])
+    if cached and cached[0] >= room['revision'] and now < cached[1]:
+        return cached[2]
+    agg = get_room_aggregate(db, room)
+    shared = build_shared_state(agg)
+    # Serialize the part every player gets identically once per build, not per poll
+    tail = orjson.dumps({key: shared[key] for key in SHARED_TAIL_KEYS})
+    shared['json_tail'] = tail[1:-1]
+    # Content hash, so pollers can revalidate against any worker's copy
+    shared['digest'] = hashlib.md5(orjson.dumps(shared['leaderboard']) + tail).hexdigest()
+    with STATE_CACHE_LOCK:
+        # A concurrent build may have stored a newer snapshot meanwhile; keep that one
+        cached = STATE_CACHE.get(room['room_id'])
+        if not cached or cached[0] <= shared['revision']:
+            cache_put(STATE_CACHE, room['room_id'], (shared['revision'], now + STATE_CACHE_TTL, shared))
+    return shared
+
+
+def room_state_etag(shared, room, player):
+    """Tag for everything the client renders, minus the countdown (which it doesn't use)"""
+    return hashlib.md5(f"{shared['digest']}|{player['id']}|{player['cash']}|{player['shares_held']}|"
+                       f"{room['current_price']}|{room['round_number']}|{room['is_active']}|"
+                       f"{room['crash_occurred']}".encode()).hexdigest()
+
+
+def room_state_body(shared, room, player):
+    """The room_state response body (JSON bytes) for one player: the per-player head
+    spliced onto the shared tail serialized in get_shared_state().
+    """
+    player_id = player['id']
+    leaderboard = [dict(entry, is_current=pid == player_id) for pid, entry in shared['leaderboard']]
+
+    if room['crash_occurred']:
+        status = STATUS_CRASHED
+        time_until = 0
+    elif room['round_number'] >= MarketEngine.MAX_ROUNDS:
+        status = STATUS_COMPLETED
+        time_until = 0
+    elif room['round_number'] == 0:
+        status = STATUS_WAITING
+        # Time until start (20s after creation)
+        time_until = max(0, 20 - room['created_age'])
+    else:
+        status = STATUS_ROUND[room['round_number']]
+        # Time until next update (10s after last update)
+        time_until = max(0, 10 - room['updated_age'])
+
+    head = orjson.dumps({
+        'success': True,
+        'revision': room['revision'],
+        'room': {
+            'current_price': room['current_price'],
+            'round_number': room['round_number'],
+            'max_rounds': MarketEngine.MAX_ROUNDS,
+            'is_active': room['is_active'],
+            'crash_occurred': room['crash_occurred'],
+            'status_message': status,
+            'time_until_update': int(time_until)
+        },
+        'player': {
+            'cash': player['cash'],
+            'shares': player['shares_held'],
+            'total_value': round(player['cash'] + player['shares_held'] * room['current_price'], 2)
+        },
+        'leaderboard': leaderboard
+    })
+    return head[:-1] + b',' + shared['json_tail'] + b'}'
+
+
+# ======================
+# WRITE QUEUE
+# ======================
+# SQLite allows one writer at a time. Rather than have request threads queue up on
+# the database lock, they hand their writes to a single writer thread, which runs
+# whatever has accumulated in one BEGIN IMMEDIATE ... COMMIT.
+WRITE_Q = queue.Queue()
+WRITE_BATCH_MAX = 64
+WRITE_BATCH_WINDOW = 0.005
+# How long a request waits for its write to *start*. Once the writer has picked a job
+# up it can't be withdrawn, so the caller then waits for the commit, however long the
+# lock takes. Kept well above one batch's worst case (busy_timeout plus the window).
+WRITE_TIMEOUT = 3 * BUSY_TIMEOUT + WRITE_BATCH_WINDOW
+
+
+def submit_write(fn, *args):
+    """Run fn(db, *args) on the writer thread and return its result once committed.
+    fn returns (result, after_commit); after_commit is None or a callable that the
+    writer runs after COMMIT, in commit order.
+    """
+    future = Future()
+    WRITE_Q.put((fn, args, future))
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except TimeoutError:
+        # Still queued: withdraw it, so a write reported as failed never happens later
+        if future.cancel():
+            raise TimeoutError("Server busy, please try again") from None
+        # Already running: its outcome is about to be decided, so report that instead
+        return future.result()
+
+
+def db_writer_loop():
+    """Background thread draining WRITE_Q in batched transactions"""
+    db = get_db_connection(autocommit=True)  # transactions are managed explicitly below
+    while True:
+        batch = [WRITE_Q.get()]
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW
+        while len(batch) < WRITE_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(WRITE_Q.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Drop jobs whose callers gave up waiting; the rest can no longer be cancelled
+        batch = [job for job in batch if job[2].set_running_or_notify_cancel()]
+        if not batch:
+            continue
+
+        outcomes = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for fn, args, future in batch:
+                # A failing job only rolls back its own savepoint
+                db.execute('SAVEPOINT job')
+                try:
+                    outcomes.append((future, fn(db, *args), None))
+                    db.execute('RELEASE job')
+                except Exception as e:
+                    db.execute('ROLLBACK TO job')
+                    db.execute('RELEASE job')
+                    outcomes.append((future, (None, None), e))
+            db.execute('COMMIT')
+        except Exception as e:
+            print(f"✗ Write batch failed: {e}")
+            try:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+            except sqlite3.Error as rollback_error:
+                # The handle itself is unusable; carry on with a fresh one
+                print(f"✗ Writer rollback failed, reconnecting: {rollback_error}")
+                db.close()
+                db = get_db_connection(autocommit=True)
+            for _, _, future in batch:
+                future.set_exception(e)
+            continue
+
+        for future, (result, after_commit), error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+                continue
+            if after_commit is not None:
+                try:
+                    after_commit()
+                except Exception as e:
+                    # Committed regardless; apply_room_delta has dropped the stale entry
+                    print(f"✗ Post-commit update failed: {e}")
+            future.set_result(result)
 
 
 # ======================
 # HELPERS
 # ======================
+@lru_cache(maxsize=4096)
+def player_identity(player_id):
+    """(room_id, player_name) of an active player; neither changes after joining"""
+    row = get_db().execute(SQL_PLAYER_IDENTITY, (player_id,)).fetchone()
+    if row is None:
+        # Raised rather than returned so that misses are not cached
+        raise LookupError(player_id)
+    return row['room_id'], row['player_name']
+
+
+def cached_holdings(room, player_id):
+    """The player's cash/shares from memory, if the cached room is at the row's revision"""
+    with ROOM_STATE_LOCK:
+        agg = ROOM_STATE.get(room['room_id'])
+        if agg is None or agg['revision'] != room['revision']:
+            return None
+        return agg['players'].get(player_id)
+
+
 def require_player(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        room_id = kwargs.get('room_id')
-        if not room_id and request.is_json:
-            room_id = request.json.get('room_id')
+        # Every protected route carries <room_id> in its URL; never parse the body for it
+        room_id = kwargs.get('room_id') or (request.view_args or {}).get('room_id')
 
         player_id = session.get('player_id')
 
@@ -300,23 +1075,26 @@ def require_player(f):
             return jsonify({'error': 'Session expired'}), 401
 
         try:
+            try:
+                player_room, player_name = player_identity(player_id)
+            except LookupError:
+                player_room = None
             db = get_db()
-            c = db.cursor()
-            c.execute('''SELECT p.*, r.is_active, r.crash_occurred, r.current_price 
-                        FROM players p JOIN rooms r ON p.room_id=r.room_id 
-                        WHERE p.id=? AND p.room_id=? AND p.is_active=1''', (player_id, room_id))
-            player = c.fetchone()
+            room = db.execute(SQL_ROOM_STATE, (room_id,)).fetchone() if player_room == room_id else None
 
-            if not player:
+            if not room:
                 session.clear()
                 return jsonify({'error': 'Player not found'}), 403
 
-            request.player = player
-            request.room = {
-                'is_active': player['is_active'],
-                'crash_occurred': player['crash_occurred'],
-                'current_price': player['current_price']
+            holdings = fresh_holdings(db, room, player_id)
+
+            request.player = {
+                'id': player_id,
+                'player_name': player_name,
+                'cash': holdings['cash'],
+                'shares_held': holdings['shares_held']
             }
+            request.room = room
             return f(*args, **kwargs)
         except Exception as e:
             print(f"Error in require_player: {e}")
@@ -325,12 +1103,86 @@ def require_player(f):
     return decorated
 
 
-def generate_room_id():
-    db = get_db()
+ROOM_ID_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+
+
+def random_room_id():
+    """Six characters from one 30-bit draw; the alphabet has exactly 32 symbols (5 bits each)"""
+    bits = random.getrandbits(30)
+    a = ROOM_ID_ALPHABET
+    return (a[bits & 31] + a[bits >> 5 & 31] + a[bits >> 10 & 31] +
+            a[bits >> 15 & 31] + a[bits >> 20 & 31] + a[bits >> 25])
+
+
+# Shape of any room id, old or new; cheap to check before a join reaches the writer
+ROOM_ID_RE = re.compile(r'[A-Z0-9]{6}')
+
+TRADE_UPDATES = {'buy': SQL_BUY_UPDATE, 'sell': SQL_SELL_UPDATE}
+SQL_ROOM_OPEN = 'SELECT 1 FROM rooms WHERE room_id=? AND is_active=1 AND crash_occurred=0'
+
+
+class MarketClosed(Exception):
+    """The market closed between the route's check and the trade reaching the writer"""
+
+
+def trade_job(db, room_id, player_id, player_name, tx_type, shares, price):
+    total = round(shares * price, 2)
+    cur = db.execute(TRADE_UPDATES[tx_type], {'total': total, 'shares': shares, 'player_id': player_id})
+    if cur.rowcount == 0:
+        # Same transaction as the UPDATE, so this sees exactly what its WHERE clause saw
+        if db.execute(SQL_ROOM_OPEN, (room_id,)).fetchone() is None:
+            raise MarketClosed(room_id)
+        return None, None
+    db.execute(SQL_INSERT_TX, (room_id, player_id, tx_type, shares, price, total))
+    revision = bump_revision(db, room_id)
+    return revision, lambda: apply_room_delta(room_id, revision, record_trade, player_id, player_name,
+                                              tx_type, shares, price, total)
+
+
+def execute_trade(room_id, player, tx_type, shares, price):
+    """Apply a buy or sell atomically.
+    Returns the new room revision, or None if the player lacks the cash or shares.
+    Raises MarketClosed if the market closed before the write landed.
+    """
+    return submit_write(trade_job, room_id, player['id'], player['player_name'], tx_type, shares, price)
+
+
+def chat_job(db, room_id, player_name, message):
+    db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
+                 VALUES (?, ?, ?, 0)''', (room_id, player_name, message))
+    revision = bump_revision(db, room_id)
+    return revision, lambda: apply_room_delta(room_id, revision, record_chat, player_name, message, False)
+
+
+def create_room_job(db, name):
+    # One round-trip per attempt; only a collision with an existing id retries
     while True:
-        rid = ''.join(random.choices('ABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=6))
-        if not db.execute("SELECT 1 FROM rooms WHERE room_id=?", (rid,)).fetchone():
-            return rid
+        room_id = random_room_id()
+        if db.execute('INSERT OR IGNORE INTO rooms (room_id) VALUES (?)', (room_id,)).rowcount:
+            break
+    player_id = db.execute('INSERT INTO players (room_id, player_name) VALUES (?, ?)', (room_id, name)).lastrowid
+    
+    # Initial system message
+    db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
+                 VALUES (?, 'SYSTEM', 'Room created. Waiting for players...', 1)''', (room_id,))
+    return (room_id, player_id), None
+
+
+def join_room_job(db, room_id, name):
+    """Returns the new player id, or None if the room is not open for joining"""
+    room = db.execute('''SELECT 1 FROM rooms WHERE room_id=? AND is_active=1 
+                        AND crash_occurred=0 AND round_number=0''', (room_id,)).fetchone()
+    if not room:
+        return None, None
+
+    player_id = db.execute('INSERT INTO players (room_id, player_name) VALUES (?, ?)', (room_id, name)).lastrowid
+    
+    # Join message
+    db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
+                 VALUES (?, 'SYSTEM', ?, 1)''', (room_id, f"{name} joined the room."))
+    revision = bump_revision(db, room_id)
+    return player_id, lambda: apply_room_delta(room_id, revision, record_join, player_id, name)
+
 
 def generate_order_book(current_price):
     """Simulate an order book around the current price"""
@@ -352,12 +1204,125 @@ def generate_order_book(current_price):
     return {'asks': list(reversed(asks)), 'bids': bids}
 
 
+# ======================
+# RESPONSE COMPRESSION
+# ======================
+# Room pages and state polls are repetitive text; gzip typically cuts them to a
+# fifth. Static files stream from disk (direct_passthrough) and are left alone.
+COMPRESS_MIMETYPES = frozenset(('text/html', 'text/css', 'application/json', 'application/javascript'))
+COMPRESS_LEVEL = 6
+# Per-response Brotli stays at a quality that costs about what gzip -6 does;
+# only bodies compressed once at startup can afford quality 11.
+BROTLI_QUALITY = 5
+COMPRESS_MIN_SIZE = 500
+
+
+def preferred_encoding():
+    """'br', 'gzip' or None: the client's highest-quality choice, br on ties"""
+    accepted = request.accept_encodings
+    encoding = accepted.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    # q=0 means "not acceptable", not "least preferred"
+    if encoding is None or accepted[encoding] <= 0:
+        return None
+    return encoding
+
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    encoding = preferred_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 # ======================
 # ROUTES
 # ======================
+def prerender_index():
+    """Render the landing page once; nothing in it varies per request.
+    Returns ({content encoding: body}, etag); None is the identity encoding.
+    """
+    with app.test_request_context('/'):
+        html = render_page('index', db_path=DB_PATH).encode('utf-8')
+    bodies = {None: html, 'gzip': gzip.compress(html, compresslevel=6)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(html, quality=11)
+    return bodies, hashlib.md5(html).hexdigest()
+
+
+ROOM_FIELDS = ('room_id', 'player_name', 'initial_cash', 'initial_shares', 'current_price',
+               'round_number', 'is_active', 'crash_occurred')
+ROOM_MARKER = re.compile(r'@@mc:(\w+)@@')
+
+
+def prerender_room_segments():
+    """Render the room page once with a marker in place of every field and split on
+    the markers. Returns the page as a list of byte literals and field names.
+    """
+    markers = {name: f'@@mc:{name}@@' for name in ROOM_FIELDS}
+    with app.test_request_context('/'):
+        html = render_page('room', **markers)
+    parts = ROOM_MARKER.split(html)
+    # re.split alternates literal, field, literal, ...
+    return [part.encode('utf-8') if i % 2 == 0 else part for i, part in enumerate(parts)]
+
+
+def render_room(**fields):
+    """Fill the prerendered room page. Like the Jinja template, does no escaping:
+    callers pass user-supplied values through markupsafe.escape first.
+    Returns bytes, or a chunk iterator while templates auto-reload.
+    """
+    if app.jinja_env.auto_reload:
+        # Template edits should show up without a restart while developing. This
+        # path really runs Jinja, so stream it rather than build the whole page first.
+        app.update_template_context(fields)
+        stream = page_template('room').stream(**fields)
+        stream.enable_buffering(8)
+        return stream_with_context(stream)
+    return _render_room_cached(tuple(fields[name] for name in ROOM_FIELDS))
+
+
+@lru_cache(maxsize=512)
+def _render_room_cached(values):
+    """The page is a pure function of its fields, so reloads and reconnects with
+    unchanged holdings reuse the bytes; nothing needs invalidating.
+    """
+    fields = dict(zip(ROOM_FIELDS, values))
+    return b''.join([seg if seg.__class__ is bytes else str(fields[seg]).encode('utf-8')
+                     for seg in ROOM_SEGMENTS])
+
+
 @app.route('/')
 def index():
-    return render_template('index.html', db_path=DB_PATH)
+    if app.jinja_env.auto_reload:
+        # Developing: render from the current template instead of the import-time bytes
+        return render_page('index', db_path=DB_PATH)
+    if request.if_none_match.contains_weak(INDEX_ETAG):
+        response = app.response_class(status=304)
+    else:
+        encoding = preferred_encoding()
+        response = app.response_class(INDEX_BODIES[encoding], mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    # Weak: the encoded bodies differ byte-wise but are the same page
+    response.set_etag(INDEX_ETAG, weak=True)
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/create_room', methods=['POST'])
@@ -367,17 +1332,7 @@ def create_room():
         if not (2 <= len(name) <= 15):
             return redirect('/')
 
-        db = get_db()
-        room_id = generate_room_id()
-        db.execute('INSERT INTO rooms (room_id) VALUES (?)', (room_id,))
-        db.execute('INSERT INTO players (room_id, player_name) VALUES (?, ?)', (room_id, name))
-        player_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
-        
-        # Initial system message
-        db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
-                     VALUES (?, 'SYSTEM', 'Room created. Waiting for players...', 1)''', (room_id,))
-        
-        db.commit()
+        room_id, player_id = submit_write(create_room_job, name)
 
         session.permanent = True
         session['player_id'] = player_id
@@ -395,25 +1350,13 @@ def join_room():
         room_id = request.form.get('room_id', '').strip().upper()
         name = request.form.get('player_name', '').strip()
 
-        if not room_id or not (2 <= len(name) <= 15):
+        if not ROOM_ID_RE.fullmatch(room_id) or not (2 <= len(name) <= 15):
             return redirect('/')
 
-        db = get_db()
-        room = db.execute('''SELECT * FROM rooms WHERE room_id=? AND is_active=1 
-                            AND crash_occurred=0 AND round_number=0''', (room_id,)).fetchone()
-
-        if not room:
+        player_id = submit_write(join_room_job, room_id, name)
+        if player_id is None:
             return redirect('/')
 
-        db.execute('INSERT INTO players (room_id, player_name) VALUES (?, ?)', (room_id, name))
-        player_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
-        
-        # Join message
-        db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
-                     VALUES (?, 'SYSTEM', ?, 1)''', (room_id, f"{name} joined the room."))
-        
-        db.commit()
-
         session.permanent = True
         session['player_id'] = player_id
         session['room_id'] = room_id
@@ -440,16 +1383,25 @@ def room(room_id):
             session.clear()
             return redirect('/')
 
-        return render_template('room.html',
-                               room_id=room_id,
-                               player_name=player['player_name'],
-                               initial_cash=player['cash'],
-                               initial_shares=player['shares_held'],
-                               current_price=player['current_price'],
-                               round_number=player['round_number'],
-                               is_active=player['is_active'],
-                               crash_occurred=player['crash_occurred']
-                               )
+        # Numbers go into the page as ready-made JS literals; cash can carry float
+        # noise like 799.9999999999 that has no business in the markup
+        body = render_room(room_id=room_id,
+                           # room_id matched an existing room, so it is
+                           # from ROOM_ID_ALPHABET; the name is free text
+                           player_name=escape(player['player_name']),
+                           initial_cash=f"{player['cash']:.2f}",
+                           initial_shares=player['shares_held'],
+                           current_price=f"{player['current_price']:.2f}",
+                           round_number=player['round_number'],
+                           is_active=player['is_active'],
+                           crash_occurred=player['crash_occurred'])
+        response = app.response_class(body, mimetype='text/html')
+        if body.__class__ is bytes:
+            # Weak for the same reason as the index page: gzip changes the bytes, not
+            # the page. No Last-Modified: holdings change without touching the room row.
+            response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+            response = response.make_conditional(request)
+        return response
     except Exception as e:
         print(f"Error in room: {e}")
         return f"Error: {str(e)}", 500
@@ -460,93 +1412,91 @@ def room(room_id):
 def room_state(room_id):
     try:
         db = get_db()
-        room = db.execute('SELECT * FROM rooms WHERE room_id=?', (room_id,)).fetchone()
-        if not room:
-            return jsonify({'error': 'Room not found'}), 404
-
-        players = db.execute('''SELECT id, player_name, cash, shares_held FROM players 
-                               WHERE room_id=? AND is_active=1 ORDER BY (cash + shares_held * ?) DESC''',
-                             (room_id, room['current_price'])).fetchall()
-
-        leaderboard = [{
-            'player_name': p['player_name'],
-            'cash': round(p['cash'], 2),
-            'shares': p['shares_held'],
-            'total_value': round(p['cash'] + p['shares_held'] * room['current_price'], 2),
-            'is_current': p['id'] == request.player['id']
-        } for p in players]
-
-        txns = db.execute('''SELECT t.*, p.player_name FROM transactions t 
-                            JOIN players p ON t.player_id=p.id WHERE t.room_id=? 
-                            ORDER BY t.timestamp DESC LIMIT 8''', (room_id,)).fetchall()
-
-        history = db.execute('''SELECT round_number, price, event_type FROM price_history 
-                               WHERE room_id=? ORDER BY round_number DESC LIMIT 10''',
-                             (room_id,)).fetchall()
-
-        # Fetch chat messages
-        chats = db.execute('''SELECT player_name, message, is_system, timestamp FROM chat_messages 
-                             WHERE room_id=? ORDER BY timestamp DESC LIMIT 50''', (room_id,)).fetchall()
-
-        chart_data = [{'round': h['round_number'], 'price': round(h['price'], 2), 'event': h['event_type']}
-                      for h in reversed(history)]
-
-        if room['crash_occurred']:
-            status = "MARKET CRASHED! Game over."
-            time_until = 0
-        elif room['round_number'] >= MarketEngine.MAX_ROUNDS:
-            status = f"Game completed {MarketEngine.MAX_ROUNDS} rounds!"
-            time_until = 0
-        elif room['round_number'] == 0:
-            status = "Waiting for players... Game starts soon!"
-            # Calculate time until start (20s after creation)
-            created = db.execute("SELECT (strftime('%s', 'now') - strftime('%s', created_at)) as diff FROM rooms WHERE room_id=?", (room_id,)).fetchone()
-            time_until = max(0, 20 - created['diff']) if created else 20
-        else:
-            status = f"Round {room['round_number']} of {MarketEngine.MAX_ROUNDS}"
-            # Calculate time until next update (10s after last update)
-            last_upd = db.execute("SELECT (strftime('%s', 'now') - strftime('%s', last_updated)) as diff FROM rooms WHERE room_id=?", (room_id,)).fetchone()
-            time_until = max(0, 10 - last_upd['diff']) if last_upd else 10
-
-        return jsonify({
-            'success': True,
-            'room': {
-                'current_price': round(room['current_price'], 2),
-                'round_number': room['round_number'],
-                'max_rounds': MarketEngine.MAX_ROUNDS,
-                'is_active': room['is_active'],
-                'crash_occurred': room['crash_occurred'],
-                'status_message': status,
-                'time_until_update': int(time_until)
-            },
-            'player': {
-                'cash': round(request.player['cash'], 2),
-                'shares': request.player['shares_held'],
-                'total_value': round(request.player['cash'] + request.player['shares_held'] * room['current_price'], 2)
-            },
-            'leaderboard': leaderboard,
-            'transactions': [{
-                'player_name': t['player_name'],
-                'type': t['type'].upper(),
-                'shares': t['shares'],
-                'price': round(t['price_per_share'], 2),
-                'total': round(t['total_amount'], 2),
-                'timestamp': str(t['timestamp'])
-            } for t in txns],
-            'price_history': chart_data,
-            'chat': [{
-                'player': c['player_name'],
-                'message': c['message'],
-                'is_system': bool(c['is_system']),
-                'time': str(c['timestamp'])[11:16] # HH:MM format
-            } for c in reversed(chats)],
-            'order_book': generate_order_book(room['current_price'])
-        })
+        room = request.room
+        player = request.player
+
+        # Long-poll: ?since=<revision from the last response> holds the request
+        # until the room changes (or LONG_POLL_TIMEOUT passes)
+        since = request.args.get('since', type=int)
+        if since is not None and since == room['revision']:
+            if not HELD_REQUESTS.acquire(blocking=False):
+                return server_busy()
+            try:
+                room = wait_for_revision(db, room_id, since, LONG_POLL_TIMEOUT)
+            finally:
+                HELD_REQUESTS.release()
+            if room is None:
+                return jsonify({'error': 'Player not found'}), 403
+            holdings = fresh_holdings(db, room, player['id']) if room['revision'] != since else None
+            if holdings is not None:
+                player = dict(player, cash=holdings['cash'], shares_held=holdings['shares_held'])
+
+        # Everything but the caller's own row is shared by all pollers of the room
+        shared = get_shared_state(db, room)
+
+        # Unchanged since the caller's last poll -> empty 304, no payload built
+        etag = room_state_etag(shared, room, player)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        # orjson encodes straight to bytes in C; this is the most frequently hit endpoint
+        response = app.response_class(room_state_body(shared, room, player),
+                                      mimetype='application/json')
+        response.set_etag(etag, weak=True)
+        return response
     except Exception as e:
         print(f"Error in room_state: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/room/<room_id>/stream')
+@require_player
+def room_stream(room_id):
+    """Server-sent events: the room_state payload, pushed whenever it changes"""
+    if not HELD_REQUESTS.acquire(blocking=False):
+        return server_busy()
+    room = request.room
+    player = dict(request.player)
+
+    def events():
+        db = get_db()
+        current_room = room
+        sent_etag = None
+        started = time.monotonic()
+        yield STREAM_RETRY
+        while time.monotonic() - started < STREAM_MAX_AGE:
+            shared = get_shared_state(db, current_room)
+            etag = room_state_etag(shared, current_room, player)
+            if etag != sent_etag:
+                sent_etag = etag
+                yield b'data: ' + room_state_body(shared, current_room, player) + b'\n\n'
+
+            row = wait_for_revision(db, room_id, current_room['revision'], STREAM_KEEPALIVE)
+            if row is None:
+                return
+            if row['revision'] == current_room['revision']:
+                # Idle for a while; a comment line keeps proxies from dropping us
+                yield b': keepalive\n\n'
+                continue
+
+            current_room = row
+            holdings = fresh_holdings(db, row, player['id'])
+            if holdings is None:
+                return
+            player['cash'] = holdings['cash']
+            player['shares_held'] = holdings['shares_held']
+
+    response = app.response_class(stream_with_context(events()), mimetype='text/event-stream')
+    # Runs when the server closes the response, whether or not the stream ever started
+    response.call_on_close(HELD_REQUESTS.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @app.route('/api/room/<room_id>/chat', methods=['POST'])
 @require_player
 def post_chat(room_id):
@@ -558,10 +1508,7 @@ def post_chat(room_id):
         if not message or len(message) > 140:
              return jsonify({'error': 'Invalid message length'}), 400
 
-        db = get_db()
-        db.execute('''INSERT INTO chat_messages (room_id, player_name, message, is_system)
-                     VALUES (?, ?, ?, 0)''', (room_id, request.player['player_name'], message))
-        db.commit()
+        submit_write(chat_job, room_id, request.player['player_name'], message)
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error in post_chat: {e}")
@@ -582,20 +1529,11 @@ def buy_shares(room_id):
             return jsonify({'error': 'Market closed'}), 400
 
         price = request.room['current_price']
-        total = shares * price
-        if request.player['cash'] < total:
-            return jsonify({'error': f'Need ${total:.2f}'}), 400
-
-        db = get_db()
-        new_cash = request.player['cash'] - total
-        new_shares = request.player['shares_held'] + shares
-        db.execute('UPDATE players SET cash=?, shares_held=? WHERE id=?',
-                   (new_cash, new_shares, request.player['id']))
-        db.execute('''INSERT INTO transactions (room_id, player_id, type, shares, price_per_share, total_amount)
-                     VALUES (?, ?, 'buy', ?, ?, ?)''',
-                   (room_id, request.player['id'], shares, price, total))
-        db.commit()
+        if execute_trade(room_id, request.player, 'buy', shares, price) is None:
+            return jsonify({'error': f'Need ${shares * price:.2f}'}), 400
         return jsonify({'success': True, 'message': f'Bought {shares} @ ${price:.2f}'})
+    except MarketClosed:
+        return jsonify({'error': 'Market closed'}), 400
     except Exception as e:
         print(f"Error in buy_shares: {e}")
         return jsonify({'error': str(e)}), 500
@@ -613,30 +1551,36 @@ def sell_shares(room_id):
             return jsonify({'error': 'Shares must be positive'}), 400
         if not request.room['is_active'] or request.room['crash_occurred']:
             return jsonify({'error': 'Market closed'}), 400
-        if request.player['shares_held'] < shares:
-            return jsonify({'error': 'Not enough shares'}), 400
 
         price = request.room['current_price']
-        total = shares * price
-        db = get_db()
-        new_cash = request.player['cash'] + total
-        new_shares = request.player['shares_held'] - shares
-        db.execute('UPDATE players SET cash=?, shares_held=? WHERE id=?',
-                   (new_cash, new_shares, request.player['id']))
-        db.execute('''INSERT INTO transactions (room_id, player_id, type, shares, price_per_share, total_amount)
-                     VALUES (?, ?, 'sell', ?, ?, ?)''',
-                   (room_id, request.player['id'], shares, price, total))
-        db.commit()
+        if execute_trade(room_id, request.player, 'sell', shares, price) is None:
+            return jsonify({'error': 'Not enough shares'}), 400
         return jsonify({'success': True, 'message': f'Sold {shares} @ ${price:.2f}'})
+    except MarketClosed:
+        return jsonify({'error': 'Market closed'}), 400
     except Exception as e:
         print(f"Error in sell_shares: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-# Initialize database and start simulation thread
+# Every route is registered by now, so url_for() in the landing page resolves
+INDEX_BODIES, INDEX_ETAG = prerender_index()
+ROOM_SEGMENTS = prerender_room_segments()
+
+# Initialize database and start background threads
 init_db()
+# Single writer for request-originated writes
+threading.Thread(target=db_writer_loop, daemon=True).start()
 # Start market simulation thread
-threading.Thread(target=market_simulation_loop, daemon=True).start()
+if RUN_SIMULATION:
+    sim_thread = threading.Thread(target=market_simulation_loop, daemon=True)
+    sim_thread.start()
+
+    @atexit.register
+    def stop_market_simulation():
+        # Let a tick that's mid-transaction commit instead of dying with the interpreter
+        SIM_SHUTDOWN.set()
+        sim_thread.join(timeout=5)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8086))
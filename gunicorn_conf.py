@@ -0,0 +1,14 @@
+"""Gunicorn settings: `gunicorn -c gunicorn_conf.py app:app`"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8086)}"
+# gthread: request handlers block in sqlite3 and wait on threading primitives
+# (writer queue, room change notifications), so real threads rather than greenlets.
+# Each open room page holds one thread for its event stream (or a long-poll), and
+# app.py caps those at threads - HELD_RESERVE (16) per worker so the rest stay free
+# for trades and page loads. That puts live push at workers * (threads - 16) viewers,
+# 96 with the defaults; viewers beyond it fall back to polling once a second.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+timeout = 60
@@ -0,0 +1,26 @@
+"""Run the market simulation as its own process.
+
+Pair it with web workers started with MARKET_CRASH_SIM=0 (see docker-compose.yml):
+ticks then never compete with request handling for the web workers' GIL. Both
+sides share the database; web workers pick up each tick through rooms.revision.
+"""
+import os
+import signal
+
+# This process runs the loop itself, in the foreground
+os.environ['MARKET_CRASH_SIM'] = '0'
+
+import app  # noqa: E402  (reads MARKET_CRASH_SIM at import; also runs init_db)
+
+
+def main():
+    # Finish the current pass and close the connection on `docker stop`
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.SIM_SHUTDOWN.set())
+    try:
+        app.market_simulation_loop()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
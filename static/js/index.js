@@ -91,8 +91,13 @@ class ParticleSystem {
         this.canvas = document.getElementById(canvasId);
         this.ctx = this.canvas.getContext('2d');
         this.particles = [];
+        // Reduced motion: draw one still frame (and redraw on resize) instead of looping
+        this.still = window.matchMedia('(prefers-reduced-motion: reduce)').matches;
         this.resize();
-        window.addEventListener('resize', () => this.resize());
+        window.addEventListener('resize', () => {
+            this.resize();
+            if (this.still) this.animate();
+        });
         this.animate();
     }
 
@@ -154,7 +159,7 @@ class ParticleSystem {
             }
         }
 
-        requestAnimationFrame(() => this.animate());
+        if (!this.still) requestAnimationFrame(() => this.animate());
     }
 }
 
@@ -180,6 +185,7 @@ class Store {
             leaderboard: []
         };
         this.listeners = [];
+        this.frame = null;
     }
 
     subscribe(listener) {
@@ -202,7 +208,17 @@ class Store {
         this.notify();
     }
 
+    // Snapshots can arrive faster than frames (a forced poll racing the stream);
+    // render the merged state once, on the next frame.
     notify() {
+        if (this.frame !== null) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.flush();
+        });
+    }
+
+    flush() {
         this.listeners.forEach(fn => fn(this.state));
     }
 }
@@ -215,6 +231,10 @@ class UIController {
         this.store = store;
         this.audio = audio;
         this.chart = null;
+        this.chartKey = null;
+        this.chartUp = null;
+        this.lbRows = [];
+        this.tradeInFlight = false;
         
         this.elements = {
             priceMain: document.getElementById('main-price'),
@@ -236,11 +256,30 @@ class UIController {
             gameOverModal: document.getElementById('game-over-modal')
         };
 
-        this.initChart();
+        this.observeChart();
         this.bindEvents();
         this.store.subscribe(this.render.bind(this));
     }
 
+    // Build the chart the first time its canvas is on screen; on small screens it
+    // can sit below the fold and never be needed.
+    observeChart() {
+        const canvas = document.getElementById('main-chart');
+        const start = () => {
+            this.initChart();
+            this.renderChart(this.store.state.history);
+        };
+        if (!('IntersectionObserver' in window)) return start();
+
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) {
+                observer.disconnect();
+                start();
+            }
+        });
+        observer.observe(canvas);
+    }
+
     initChart() {
         const ctx = document.getElementById('main-chart').getContext('2d');
         const gradient = ctx.createLinearGradient(0, 0, 0, 400);
@@ -319,6 +358,8 @@ class UIController {
     }
 
     executeTrade(type) {
+        // One order at a time: a double-click (or double-tap) would otherwise send two
+        if (this.tradeInFlight) return;
         const amount = parseInt(document.getElementById(`${type}-amount`).value);
         if (!amount || amount <= 0) return this.showToast('Invalid amount', 'error');
 
@@ -330,6 +371,7 @@ class UIController {
             return this.showToast('Insufficient shares', 'error');
         }
 
+        this.setTradeInFlight(true);
         fetch(`/api/room/${CONFIG.roomId}/${type}`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -346,7 +388,14 @@ class UIController {
                 this.showToast(data.error, 'error');
                 this.audio.playAlert();
             }
-        });
+        })
+        .finally(() => this.setTradeInFlight(false));
+    }
+
+    setTradeInFlight(pending) {
+        this.tradeInFlight = pending;
+        this.elements.btnBuy.disabled = pending;
+        this.elements.btnSell.disabled = pending;
     }
 
     sendChat() {
@@ -407,22 +456,7 @@ class UIController {
         }
 
         // 2. Chart Update
-        if (state.history.length > 0) {
-            this.chart.data.labels = state.history.map(h => h.round);
-            this.chart.data.datasets[0].data = state.history.map(h => h.price);
-            
-            // Dynamic color based on trend
-            const isUp = state.history[state.history.length-1].price >= state.history[0].price;
-            const color = isUp ? CONSTANTS.THEME.BULL : CONSTANTS.THEME.BEAR;
-            this.chart.data.datasets[0].borderColor = color;
-            this.chart.data.datasets[0].backgroundColor = (ctx) => {
-                const grad = ctx.chart.ctx.createLinearGradient(0, 0, 0, 400);
-                grad.addColorStop(0, isUp ? 'rgba(0, 240, 144, 0.5)' : 'rgba(255, 42, 77, 0.5)');
-                grad.addColorStop(1, 'rgba(0,0,0,0)');
-                return grad;
-            };
-            this.chart.update();
-        }
+        this.renderChart(state.history);
 
         // 3. Order Book
         this.renderOrderBook(state.orderBook);
@@ -453,6 +487,49 @@ class UIController {
         this.renderLeaderboard(state.leaderboard);
     }
 
+    renderChart(history) {
+        // Not built yet: observeChart() renders the latest history once it is
+        if (!this.chart || history.length === 0) return;
+
+        // The chart redraw is the costliest part of a render; skip it unless a round was added
+        const last = history[history.length-1];
+        const key = `${history.length}:${last.round}:${last.price}`;
+        if (key === this.chartKey) return;
+        this.chartKey = key;
+
+        // The history is a sliding window of recent rounds. When exactly one round was
+        // added, append it (and drop the oldest) rather than swapping in new arrays.
+        const { labels } = this.chart.data;
+        const dataset = this.chart.data.datasets[0];
+        const prevRound = labels[labels.length-1];
+        if (history.length > 1 && history[history.length-2].round === prevRound
+                && last.round === prevRound + 1) {
+            labels.push(last.round);
+            dataset.data.push(last.price);
+            while (labels.length > history.length) {
+                labels.shift();
+                dataset.data.shift();
+            }
+        } else {
+            this.chart.data.labels = history.map(h => h.round);
+            dataset.data = history.map(h => h.price);
+        }
+
+        // Dynamic color based on trend; the gradient only needs replacing when it flips
+        const isUp = last.price >= history[0].price;
+        if (isUp !== this.chartUp) {
+            this.chartUp = isUp;
+            dataset.borderColor = isUp ? CONSTANTS.THEME.BULL : CONSTANTS.THEME.BEAR;
+            dataset.backgroundColor = (ctx) => {
+                const grad = ctx.chart.ctx.createLinearGradient(0, 0, 0, 400);
+                grad.addColorStop(0, isUp ? 'rgba(0, 240, 144, 0.5)' : 'rgba(255, 42, 77, 0.5)');
+                grad.addColorStop(1, 'rgba(0,0,0,0)');
+                return grad;
+            };
+        }
+        this.chart.update('none');
+    }
+
     renderOrderBook(book) {
         if (!book.asks) return;
         
@@ -510,15 +587,31 @@ class UIController {
     }
 
     renderLeaderboard(lb) {
-        this.elements.lbList.innerHTML = lb.map((p, i) => `
-            <div class="flex-row justify-between p-2 border-b border-white/5 ${p.is_current ? 'bg-blue/10' : ''}">
+        // Rows are pooled: grow or trim the list to fit, then rewrite cells in place
+        // rather than rebuilding the markup on every snapshot.
+        while (this.lbRows.length < lb.length) {
+            const row = document.createElement('div');
+            row.innerHTML = `
                 <div class="flex-center gap-sm">
-                    <span class="text-dim text-mono w-4">#${i+1}</span>
-                    <span class="font-bold text-sm ${p.is_current ? 'text-blue' : ''}">${p.player_name}</span>
+                    <span class="text-dim text-mono w-4"></span>
+                    <span></span>
                 </div>
-                <span class="text-mono text-sm">$${p.total_value.toFixed(2)}</span>
-            </div>
-        `).join('');
+                <span class="text-mono text-sm"></span>
+            `;
+            const [rank, name] = row.firstElementChild.children;
+            this.lbRows.push({ row, rank, name, value: row.lastElementChild });
+            this.elements.lbList.appendChild(row);
+        }
+        while (this.lbRows.length > lb.length) this.lbRows.pop().row.remove();
+
+        lb.forEach((p, i) => {
+            const cells = this.lbRows[i];
+            cells.row.className = `flex-row justify-between p-2 border-b border-white/5 ${p.is_current ? 'bg-blue/10' : ''}`;
+            cells.rank.textContent = `#${i+1}`;
+            cells.name.className = `font-bold text-sm ${p.is_current ? 'text-blue' : ''}`;
+            cells.name.textContent = p.player_name;
+            cells.value.textContent = `$${p.total_value.toFixed(2)}`;
+        });
     }
 
     triggerGameOver(title, score) {
@@ -552,32 +645,101 @@ window.toggleSound = () => {
     ui.showToast(s ? 'Sound Enabled' : 'Sound Muted', 'info');
 };
 
-// Polling Loop
+// State Updates
+// The server pushes a snapshot over SSE whenever the room changes. Plain polling
+// remains for the first paint, right after our own trades/chats, and as the
+// fallback when EventSource is missing or the stream can't be opened.
+// Every player-driven or tick change (trades, joins, chat, new rounds) bumps the room
+// revision. A snapshot for a revision we've already applied - the same revision by
+// poll and by stream, or a long-poll that timed out - can differ only in the simulated
+// order book, which the server regenerates between writes; redraw just that panel.
+let appliedRevision = null;
+
+// require_player's answers when the session or the player is gone; nothing to retry
+function isSessionError(data) {
+    return data.error === 'Session expired' || data.error === 'Player not found';
+}
+
+function applyState(data) {
+    if (data.success) {
+        if (data.revision === appliedRevision) {
+            store.state.orderBook = data.order_book;
+            ui.renderOrderBook(data.order_book);
+            return;
+        }
+        appliedRevision = data.revision;
+        store.setState({
+            price: data.room.current_price,
+            round: data.room.round_number,
+            isActive: data.room.is_active,
+            crashed: !!data.room.crash_occurred,
+            cash: data.player.cash,
+            shares: data.player.shares,
+            history: data.price_history,
+            chat: data.chat,
+            orderBook: data.order_book,
+            leaderboard: data.leaderboard
+        });
+    } else if (isSessionError(data)) {
+        window.location.href = '/';
+    }
+}
+
+// The server tags each snapshot; echoing the tag back turns an unchanged poll
+// into an empty 304 that needs no parsing or re-rendering.
+let stateEtag = null;
+
 async function pollState() {
     try {
-        const res = await fetch(`/api/room/${CONFIG.roomId}/state`);
-        const data = await res.json();
-        
-        if (data.success) {
-            store.setState({
-                price: data.room.current_price,
-                round: data.room.round_number,
-                isActive: data.room.is_active,
-                crashed: !!data.room.crash_occurred,
-                cash: data.player.cash,
-                shares: data.player.shares,
-                history: data.price_history,
-                chat: data.chat,
-                orderBook: data.order_book,
-                leaderboard: data.leaderboard
-            });
-        } else if (data.error === 'Session expired') {
-            window.location.href = '/';
-        }
+        const res = await fetch(`/api/room/${CONFIG.roomId}/state`, {
+            cache: 'no-store',
+            headers: stateEtag ? { 'If-None-Match': stateEtag } : {}
+        });
+        if (res.status === 304) return;
+        stateEtag = res.headers.get('ETag');
+        applyState(await res.json());
     } catch (e) {
         console.error("Poll error:", e);
     }
 }
 
-setInterval(pollState, CONSTANTS.POLL_INTERVAL);
+// Fallback transport: long-poll. Passing back the last revision makes the server
+// hold the request until the room changes, so an idle room costs one request per
+// LONG_POLL_TIMEOUT instead of one per second.
+let polling = false;
+
+async function startPolling() {
+    if (polling) return;
+    polling = true;
+    let since = null;
+    while (true) {
+        try {
+            const query = since === null ? '' : `?since=${since}`;
+            const res = await fetch(`/api/room/${CONFIG.roomId}/state${query}`, { cache: 'no-store' });
+            const data = await res.json();
+            applyState(data);
+            if (isSessionError(data)) break;
+            // Any other error (e.g. a transient 500) gets the same back-off as a network error
+            if (!data.success) throw new Error(data.error);
+            since = data.revision;
+        } catch (e) {
+            console.error("Poll error:", e);
+            await new Promise(resolve => setTimeout(resolve, CONSTANTS.POLL_INTERVAL));
+        }
+    }
+}
+
+function startStream() {
+    if (!('EventSource' in window)) return startPolling();
+
+    const stream = new EventSource(`/api/room/${CONFIG.roomId}/stream`);
+    stream.onmessage = (e) => applyState(JSON.parse(e.data));
+    stream.onerror = () => {
+        // CONNECTING means the browser is already retrying (e.g. after the server's
+        // periodic stream rotation); CLOSED means it gave up, so poll instead.
+        if (stream.readyState === EventSource.CLOSED) startPolling();
+    };
+}
+
 pollState(); // Init
+startStream();